@@ -0,0 +1,194 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from app.core.config import (
+    CLIENT_MISS_BURST,
+    CLIENT_MISS_RATE_PER_MIN,
+    GLOBAL_MISS_BURST,
+    GLOBAL_MISS_RATE_PER_MIN,
+    KEYWORDS_BY_CATEGORY,
+    MAX_CONCURRENT_MISSES,
+    MAX_QUEUED_MISSES,
+    MISS_FOLLOWER_TIMEOUT_SECONDS,
+    MISS_QUEUE_TIMEOUT_SECONDS,
+    TRUSTED_PROXY_HOPS,
+)
+from app.core.profiling import stage
+
+# Upper bound on remembered clients so a flood of spoofed IPs can't grow memory forever
+MAX_TRACKED_CLIENTS = 10_000
+
+
+class AdmissionRejected(Exception):
+    """Raised when a cache-missing request is shed instead of reaching Gemini."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class _Generation:
+    """Outcome of one in-flight generation, shared with the requests waiting on it."""
+
+    def __init__(self):
+        self.done = asyncio.Event()
+        self.result = None
+        self.error = None
+
+
+class TokenBucket:
+    """Classic token bucket: `burst` tokens, refilled at `rate_per_min`."""
+
+    def __init__(self, rate_per_min: float, burst: int):
+        self.rate = rate_per_min / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until one token is available (0 if one is available now)."""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        if self.rate <= 0:
+            return 60.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+
+class AdmissionController:
+    """
+    Gatekeeper for requests that will trigger a Gemini generation.
+    1. Known categories (KEYWORDS_BY_CATEGORY) skip the rate limits - they are a bounded set.
+    2. Everything else needs a token from both the client's bucket and the global bucket;
+       tokens are only spent once the request actually gets a generation slot.
+    3. At most `max_concurrent` generations run at once; up to `max_queued` more wait,
+       anything beyond that (or waiting too long) is shed with a Retry-After hint.
+    4. `coalesce(category, produce)` runs one generation per category; concurrent
+       requests for it wait for that result instead of queueing for their own.
+    """
+
+    def __init__(self):
+        self.client_buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self.global_bucket = TokenBucket(GLOBAL_MISS_RATE_PER_MIN, GLOBAL_MISS_BURST)
+        self.slots = asyncio.Semaphore(MAX_CONCURRENT_MISSES)
+        self.queued = 0
+        # category -> the generation currently running for it
+        self.generating: dict[str, _Generation] = {}
+
+    def _client_bucket(self, client_id: str) -> TokenBucket:
+        bucket = self.client_buckets.get(client_id)
+        if bucket is None:
+            bucket = TokenBucket(CLIENT_MISS_RATE_PER_MIN, CLIENT_MISS_BURST)
+            self.client_buckets[client_id] = bucket
+            if len(self.client_buckets) > MAX_TRACKED_CLIENTS:
+                self.client_buckets.popitem(last=False)
+        else:
+            self.client_buckets.move_to_end(client_id)
+        return bucket
+
+    def _check_rate(self, client_id: str, category: str, spend: bool):
+        """Reject if either bucket is empty; with `spend`, take a token from both."""
+        if category in KEYWORDS_BY_CATEGORY:
+            return
+
+        client_bucket = self._client_bucket(client_id)
+        client_wait = client_bucket.wait_time()
+        if client_wait:
+            raise AdmissionRejected("Too many new categories requested, slow down.", client_wait)
+
+        global_wait = self.global_bucket.wait_time()
+        if global_wait:
+            raise AdmissionRejected("Trend generation is busy, try again shortly.", global_wait)
+
+        # Only spend tokens once both buckets agreed
+        if spend:
+            client_bucket.take()
+            self.global_bucket.take()
+
+    async def _wait_in_queue(self, busy: bool, acquire):
+        """Wait for `acquire()` as one of the bounded queue's entries."""
+        if busy and self.queued >= MAX_QUEUED_MISSES:
+            raise AdmissionRejected("Trend generation queue is full.", MISS_QUEUE_TIMEOUT_SECONDS)
+
+        self.queued += 1
+        try:
+            with stage("admission.wait"):
+                await asyncio.wait_for(acquire(), timeout=MISS_QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise AdmissionRejected("Timed out waiting for trend generation.", MISS_QUEUE_TIMEOUT_SECONDS)
+        finally:
+            self.queued -= 1
+
+    async def coalesce(self, category: str, produce):
+        """
+        Return `await produce()`, running it at most once per category at a time.
+        Followers (requests arriving while it runs) wait for the leader's result with a
+        timeout that covers the leader's slot wait plus the Gemini call, and take no
+        place in the miss queue. If the leader was shed or cancelled, a follower takes over.
+        """
+        while True:
+            generation = self.generating.get(category)
+            if generation is None:
+                break
+            try:
+                with stage("admission.follow"):
+                    await asyncio.wait_for(generation.done.wait(), timeout=MISS_FOLLOWER_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                raise AdmissionRejected("Timed out waiting for trend generation.", MISS_QUEUE_TIMEOUT_SECONDS)
+            if generation.result is not None:
+                return generation.result
+            if generation.error is not None and not isinstance(generation.error, AdmissionRejected):
+                raise generation.error
+
+        generation = self.generating[category] = _Generation()
+        try:
+            generation.result = await produce()
+            return generation.result
+        except Exception as e:
+            generation.error = e
+            raise
+        finally:
+            del self.generating[category]
+            generation.done.set()
+
+    @asynccontextmanager
+    async def admit(self, client_id: str, category: str):
+        """Take a generation slot; rate tokens are only spent once the slot is ours."""
+        # Early check so doomed requests don't occupy the queue
+        self._check_rate(client_id, category, spend=False)
+        await self._wait_in_queue(self.slots.locked(), self.slots.acquire)
+
+        try:
+            self._check_rate(client_id, category, spend=True)
+            yield
+        finally:
+            self.slots.release()
+
+
+def client_id_from(request) -> str:
+    """
+    Client identity for rate limiting.
+    Only the X-Forwarded-For entry appended by our own proxy (TRUSTED_PROXY_HOPS from
+    the right) is trusted; anything to its left is whatever the client chose to send.
+    """
+    if TRUSTED_PROXY_HOPS > 0:
+        forwarded = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+        if len(forwarded) >= TRUSTED_PROXY_HOPS:
+            return forwarded[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+
+admission = AdmissionController()
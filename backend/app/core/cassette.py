@@ -0,0 +1,152 @@
+import atexit
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import orjson
+
+from app.core.config import CASSETTE_MODE, CASSETTE_PATH, CASSETTE_SPEED
+
+CASSETTE_VERSION = 1
+
+RECORDING = CASSETTE_MODE == "record"
+REPLAYING = CASSETTE_MODE == "replay"
+
+
+class CassetteError(Exception):
+    """
+    Replay problem: missing interaction or incompatible cassette.
+    Callers must let it propagate rather than treat it like an upstream failure.
+    """
+
+
+class RecordedFailure(Exception):
+    """Replay of an upstream call that failed while recording; handled like the live failure."""
+
+
+class Cassette:
+    """
+    Recorded upstream interactions, keyed by call name + arguments.
+    Each key keeps every response (in call order) and its latency, so replay
+    can walk the same sequence at recorded - or scaled - speed.
+
+    File layout:
+        {"version": 1, "recordedAt": ..., "interactions": {
+            "<name> <args json>": {"responses": [...], "latenciesMs": [...]}}}
+    Responses are either {"value": ...} or {"error": "..."}.
+    `recordedAt` is when recording started (kept when appending); replay runs its clock from it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.interactions = {}
+        self.cursors = {}
+        self.lock = threading.Lock()
+        self.recorded_at = datetime.now(timezone.utc)
+        self.loaded_at = time.monotonic()
+
+    def load(self):
+        with open(self.path, "rb") as f:
+            data = orjson.loads(f.read())
+        if data.get("version") != CASSETTE_VERSION:
+            raise CassetteError(f"Cassette {self.path} is version {data.get('version')}, expected {CASSETTE_VERSION}")
+        self.interactions = data["interactions"]
+        self.recorded_at = datetime.fromisoformat(data["recordedAt"])
+        self.loaded_at = time.monotonic()
+        return self
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            data = {
+                "version": CASSETTE_VERSION,
+                "recordedAt": self.recorded_at.isoformat(),
+                "interactions": orjson.loads(orjson.dumps(self.interactions))
+            }
+        # Write-then-rename so an interrupted run never leaves a truncated cassette
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_path, self.path)
+
+    def record(self, key: str, response: dict, latency_ms: float):
+        """In-memory only; the file is written once when the process exits."""
+        with self.lock:
+            entry = self.interactions.setdefault(key, {"responses": [], "latenciesMs": []})
+            entry["responses"].append(response)
+            entry["latenciesMs"].append(round(latency_ms, 2))
+
+    def next(self, key: str):
+        """Next (response, latency_ms) for a key, cycling once the recording runs out."""
+        with self.lock:
+            entry = self.interactions.get(key)
+            if entry is None:
+                raise CassetteError(f"No recorded interaction for {key}")
+            cursor = self.cursors.get(key, 0)
+            self.cursors[key] = cursor + 1
+            i = cursor % len(entry["responses"])
+            return entry["responses"][i], entry["latenciesMs"][i]
+
+
+_cassette = None
+
+
+def _get_cassette() -> Cassette:
+    global _cassette
+    if _cassette is None:
+        cassette = Cassette(CASSETTE_PATH)
+        if REPLAYING or os.path.exists(CASSETTE_PATH):
+            # Recording into an existing file appends to it
+            cassette.load()
+        if RECORDING:
+            atexit.register(cassette.save)
+        _cassette = cassette
+    return _cassette
+
+
+def now() -> datetime:
+    """
+    Current UTC time for freshness checks. When replaying, this is the recording's clock
+    (recordedAt + time since the cassette was loaded), so cached rows that were fresh
+    while recording are still fresh on replay, however old the cassette is.
+    """
+    if not REPLAYING:
+        return datetime.now(timezone.utc)
+    cassette = _get_cassette()
+    return cassette.recorded_at + timedelta(seconds=time.monotonic() - cassette.loaded_at)
+
+
+def call(name: str, args: tuple, fn):
+    """
+    Run an upstream call through the cassette.
+    `args` identifies the interaction and must be JSON-serializable; so must fn()'s result.
+    - off: just fn()
+    - record: fn(), saving its result (or error) and latency
+    - replay: no network; return the recorded result after the recorded latency * CASSETTE_SPEED
+      (RecordedFailure for a recorded error, CassetteError if nothing was recorded for the call)
+    """
+    if not (RECORDING or REPLAYING):
+        return fn()
+
+    key = f"{name} {orjson.dumps(args).decode()}"
+    cassette = _get_cassette()
+
+    if REPLAYING:
+        response, latency_ms = cassette.next(key)
+        if CASSETTE_SPEED > 0:
+            time.sleep(latency_ms * CASSETTE_SPEED / 1000)
+        if "error" in response:
+            raise RecordedFailure(response["error"])
+        return response["value"]
+
+    start = time.perf_counter()
+    try:
+        value = fn()
+    except Exception as e:
+        cassette.record(key, {"error": str(e)}, (time.perf_counter() - start) * 1000)
+        raise
+    cassette.record(key, {"value": value}, (time.perf_counter() - start) * 1000)
+    return value
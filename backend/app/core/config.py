@@ -1,6 +1,42 @@
 import os
 
 CACHE_TTL_HOURS = int(os.getenv("CACHE_TTL_HOURS", 6))
+# How long the in-process trends copy is trusted before a cheap last_updated/etag check against Supabase
+CACHE_REVALIDATE_SECONDS = float(os.getenv("CACHE_REVALIDATE_SECONDS", 30))
+
+# Admission control for cache-missing /api/trends requests (each one is a Gemini call)
+CLIENT_MISS_RATE_PER_MIN = float(os.getenv("CLIENT_MISS_RATE_PER_MIN", 3))
+CLIENT_MISS_BURST = int(os.getenv("CLIENT_MISS_BURST", 3))
+GLOBAL_MISS_RATE_PER_MIN = float(os.getenv("GLOBAL_MISS_RATE_PER_MIN", 30))
+GLOBAL_MISS_BURST = int(os.getenv("GLOBAL_MISS_BURST", 10))
+MAX_CONCURRENT_MISSES = int(os.getenv("MAX_CONCURRENT_MISSES", 4))
+MAX_QUEUED_MISSES = int(os.getenv("MAX_QUEUED_MISSES", 16))
+MISS_QUEUE_TIMEOUT_SECONDS = float(os.getenv("MISS_QUEUE_TIMEOUT_SECONDS", 20))
+# Requests for a category that is already generating wait for that generation (slot wait + Gemini call)
+MISS_FOLLOWER_TIMEOUT_SECONDS = float(os.getenv("MISS_FOLLOWER_TIMEOUT_SECONDS", 90))
+# Proxies in front of the app that append to X-Forwarded-For (1 on Render); 0 = use the socket peer
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 1))
+
+# How many recent generations per category are kept in memory for momentum / drift
+SNAPSHOT_HISTORY_DEPTH = int(os.getenv("SNAPSHOT_HISTORY_DEPTH", 8))
+
+# Related-trends index (hashed trigram embeddings) and in-category near-duplicate cutoff
+SIMILARITY_DIM = int(os.getenv("SIMILARITY_DIM", 1024))
+DUPLICATE_SIMILARITY = float(os.getenv("DUPLICATE_SIMILARITY", 0.8))
+
+# Opt-in request profiling (admins can also ask for it per request with `X-Profile: 1`)
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "False") == "True"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", 1500))
+PROFILE_SAMPLER_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLER_INTERVAL_MS", 5))
+PROFILE_KEEP_SLOWEST = int(os.getenv("PROFILE_KEEP_SLOWEST", 20))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Record/replay of upstream (Gemini, Supabase) calls: "off", "record" or "replay"
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off")
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", "cassettes/default.json")
+# Replay latency multiplier: 1 = recorded speed, 0.5 = twice as fast, 0 = no delay
+CASSETTE_SPEED = float(os.getenv("CASSETTE_SPEED", 1))
 
 KEYWORDS_BY_CATEGORY = {
     "decor": [
@@ -0,0 +1,203 @@
+import asyncio
+import heapq
+import hmac
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from app.core.config import (
+    ADMIN_TOKEN,
+    PROFILE_KEEP_SLOWEST,
+    PROFILE_REQUESTS,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_SAMPLER_INTERVAL_MS,
+    PROFILE_SLOW_MS,
+)
+
+MAX_STACK_DEPTH = 64
+
+
+class RequestProfile:
+    """Timed pipeline stages (and the worker threads currently running them) for one profiled request."""
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now(timezone.utc)
+        self.stages = []
+        # thread id -> number of this request's stages open in it; only these threads are sampled
+        self.active_threads = Counter()
+        self.lock = threading.Lock()
+
+    def add_stage(self, name: str, ms: float):
+        self.stages.append({"stage": name, "ms": round(ms, 2)})
+
+    def enter_thread(self, thread_id: int):
+        with self.lock:
+            self.active_threads[thread_id] += 1
+
+    def exit_thread(self, thread_id: int):
+        with self.lock:
+            self.active_threads[thread_id] -= 1
+            if not self.active_threads[thread_id]:
+                del self.active_threads[thread_id]
+
+    def sampled_threads(self) -> list:
+        with self.lock:
+            return list(self.active_threads)
+
+
+_current: ContextVar[RequestProfile | None] = ContextVar("request_profile", default=None)
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage for the current request; a no-op when it isn't being profiled."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+
+    # The event loop thread is shared by every request (and mostly idles in the selector),
+    # so only worker threads are sampled, and only while this stage runs in them
+    thread_id = None if _on_event_loop() else threading.get_ident()
+    if thread_id is not None:
+        profile.enter_thread(thread_id)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_stage(name, (time.perf_counter() - start) * 1000)
+        if thread_id is not None:
+            profile.exit_thread(thread_id)
+
+
+class StackSampler(threading.Thread):
+    """
+    Poor man's sampling profiler: every interval, grab the stacks of the
+    worker threads currently inside one of the request's stages and count
+    them in collapsed/folded form (`root;caller;callee count`), ready for
+    flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, profile: RequestProfile):
+        super().__init__(daemon=True)
+        self.profile = profile
+        self.interval = PROFILE_SAMPLER_INTERVAL_MS / 1000
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in self.profile.sampled_threads():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.stacks[self._fold(frame)] += 1
+
+    @staticmethod
+    def _fold(frame) -> str:
+        names = []
+        while frame is not None and len(names) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def stop(self) -> str:
+        self.stopped.set()
+        self.join()
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class SlowestRequests:
+    """Keeps the N slowest profiled requests (min-heap, so the fastest is evicted first)."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.heap = []
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def add(self, duration_ms: float, entry: dict):
+        item = (duration_ms, next(self.counter), entry)
+        with self.lock:
+            if len(self.heap) < self.size:
+                heapq.heappush(self.heap, item)
+            elif duration_ms > self.heap[0][0]:
+                heapq.heapreplace(self.heap, item)
+
+    def snapshot(self) -> list:
+        with self.lock:
+            return [entry for _, _, entry in sorted(self.heap, reverse=True)]
+
+
+slowest_requests = SlowestRequests(PROFILE_KEEP_SLOWEST)
+
+
+def is_admin(request) -> bool:
+    """Constant-time check of the X-Admin-Token header; always False when ADMIN_TOKEN is unset."""
+    if not ADMIN_TOKEN:
+        return False
+    token = request.headers.get("x-admin-token", "")
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+async def profile_requests(request, call_next):
+    """
+    HTTP middleware: profiles admin requests that send `X-Profile: 1` (with a valid
+    X-Admin-Token), plus a PROFILE_SAMPLE_RATE share of traffic or everything (PROFILE_REQUESTS).
+    Only the admin-requested profiles get a Server-Timing header; requests slower than
+    PROFILE_SLOW_MS keep their flame graph in the slowest-requests buffer.
+    """
+    admin_requested = request.headers.get("x-profile") == "1" and is_admin(request)
+    sampled = PROFILE_REQUESTS or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+    if not (admin_requested or sampled):
+        return await call_next(request)
+
+    profile = RequestProfile(request.method, request.url.path)
+    token = _current.set(profile)
+    sampler = StackSampler(profile)
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        total_ms = (time.perf_counter() - start) * 1000
+        folded = sampler.stop()
+        _current.reset(token)
+
+    entry = {
+        "method": profile.method,
+        "path": profile.path,
+        "query": request.url.query,
+        "status": response.status_code,
+        "startedAt": profile.started_at.isoformat(),
+        "totalMs": round(total_ms, 2),
+        "stages": profile.stages,
+        "flamegraph": folded if total_ms >= PROFILE_SLOW_MS else None
+    }
+    slowest_requests.add(total_ms, entry)
+
+    if not admin_requested:
+        return response
+
+    timings = [f"{s['stage']};dur={s['ms']}" for s in profile.stages]
+    timings.append(f"total;dur={round(total_ms, 2)}")
+    response.headers["Server-Timing"] = ", ".join(timings)
+    return response
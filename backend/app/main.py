@@ -47,11 +47,18 @@
 
 
 
-from fastapi import FastAPI
+from datetime import datetime
+from fastapi import FastAPI, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 # Import the engine (Logic layer) instead of the raw service
 # (Make sure app.services.trend_engine exists in your project structure)
-from app.services.trend_engine import get_trends 
+from app.services.trend_engine import get_related_trends, get_trends_response
+from app.services.snapshot_store import diff_since
+from app.core.admission import AdmissionRejected, admission, client_id_from
+from app.core.cassette import CassetteError
+from app.core.profiling import is_admin, profile_requests, slowest_requests
 
 # 1. Initialize API (Only once!)
 app = FastAPI(title="Artisan Trend Spotter API")
@@ -71,32 +78,111 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in profiling (admin X-Profile header, PROFILE_SAMPLE_RATE or PROFILE_REQUESTS)
+app.middleware("http")(profile_requests)
+
 # 3. Root Route (Health Check for Render)
 @app.get("/")
 def read_root():
     return {"status": "ok", "message": "Backend is running"}
 
+async def _generate_trends(client_id: str, category: str) -> bytes:
+    # A generation that finished just before this one started may already have filled the cache
+    body = await run_in_threadpool(get_trends_response, category, False)
+    if body is None:
+        async with admission.admit(client_id, category):
+            body = await run_in_threadpool(get_trends_response, category)
+    return body
+
 # 4. Trends Route (Your Logic)
 @app.get("/api/trends")
-async def fetch_trends(category: str = "handicrafts"):
+async def fetch_trends(request: Request, category: str = "handicrafts"):
     """
     Endpoint that triggers the Trend Engine.
     The Engine handles the Cache (Supabase) and the AI (Gemini).
+    Cache hits are served straight away; misses go through admission control.
     """
     try:
         # Use the logic from trend_engine.py
-        processed_trends = get_trends(category)
+        # The body is encoded once per refresh, so hits just hand back cached bytes
+        body = await run_in_threadpool(get_trends_response, category, False)
+        if body is None:
+            # One generation per category at a time; concurrent misses share its result
+            client_id = client_id_from(request)
+            body = await admission.coalesce(category, lambda: _generate_trends(client_id, category))
         
-        return {
-            "status": "success",
-            "category": category,
-            "count": len(processed_trends),
-            "data": processed_trends
-        }
+        return Response(content=body, media_type="application/json")
+    except AdmissionRejected as e:
+        print(f"Shedding trends request for {category}: {e.reason}")
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": str(e.retry_after)},
+            content={"status": "error", "message": e.reason, "data": []}
+        )
+    except CassetteError:
+        # Replay hit an unrecorded call: surface it as a server error
+        raise
     except Exception as e:
         print(f"Error fetching trends: {e}")
         return {
             "status": "error", 
             "message": str(e), 
             "data": []
-        }
\ No newline at end of file
+        }
+
+
+# 5. Trend Diff Route (answered from the snapshot history, never calls Gemini)
+@app.get("/api/trends/{category}/diff")
+async def fetch_trend_diff(category: str, since: datetime):
+    """What rose, fell, appeared or dropped in a category since the given time."""
+    try:
+        diff = await run_in_threadpool(diff_since, category, since)
+        return {
+            "status": "success",
+            "category": category,
+            "since": since.isoformat(),
+            "data": diff
+        }
+    except CassetteError:
+        raise
+    except Exception as e:
+        print(f"Error diffing trends: {e}")
+        return {
+            "status": "error",
+            "message": str(e),
+            "data": {}
+        }
+
+
+# 6. Related Trends Route (local similarity index, no LLM call)
+@app.get("/api/trends/{trend_id}/related")
+async def fetch_related_trends(trend_id: str, k: int = Query(default=5, ge=1, le=20)):
+    """Trends similar to the given card, answered from the in-memory vector index."""
+    related = await run_in_threadpool(get_related_trends, trend_id, k)
+    if related is None:
+        return JSONResponse(
+            status_code=404,
+            content={"status": "error", "message": f"Unknown trend id: {trend_id}", "data": []}
+        )
+    return {
+        "status": "success",
+        "id": trend_id,
+        "count": len(related),
+        "data": related
+    }
+
+
+# 7. Admin: slowest profiled requests (stage breakdown + folded flame graph)
+@app.get("/api/admin/slow-requests")
+def fetch_slow_requests(request: Request):
+    if not is_admin(request):
+        return JSONResponse(
+            status_code=403,
+            content={"status": "error", "message": "Admin token required", "data": []}
+        )
+    requests = slowest_requests.snapshot()
+    return {
+        "status": "success",
+        "count": len(requests),
+        "data": requests
+    }
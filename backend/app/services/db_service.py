@@ -1,29 +1,170 @@
+import base64
+import hashlib
 import os
+import orjson
+import zstandard
 from supabase import create_client, Client
 from dotenv import load_dotenv
+from app.core import cassette
+from app.core.profiling import stage
 load_dotenv()
 
 url: str = os.environ.get("SUPABASE_URL")
 key: str = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
+# Replay runs fully offline, so there is no client to create
+supabase: Client = None if cassette.REPLAYING else create_client(url, key)
+
+_COMPRESSOR = zstandard.ZstdCompressor(level=10)
+_DECOMPRESSOR = zstandard.ZstdDecompressor()
+
+# category -> (etag, decoded trends) of the last payload we fetched or wrote
+_PAYLOADS = {}
+
+def _pack(trends: list):
+    """Trend list -> (etag, base64 zstd blob). The etag is a hash of the uncompressed JSON."""
+    raw = orjson.dumps(trends)
+    etag = hashlib.blake2b(raw, digest_size=8).hexdigest()
+    return etag, base64.b64encode(_COMPRESSOR.compress(raw)).decode("ascii")
+
+def _unpack(blob: str) -> list:
+    return orjson.loads(_DECOMPRESSOR.decompress(base64.b64decode(blob)))
+
+def get_trends_meta(category: str):
+    """Cheap projected read: just `last_updated` and `etag` for the category (no payload)."""
+    try:
+        with stage("supabase.fetch_meta"):
+            rows = cassette.call("supabase.fetch_meta", (category,), lambda: (
+                supabase.table("market_trends").select("last_updated, etag").eq("category", category).execute().data
+            ))
+        return rows[0] if rows else None
+    except cassette.CassetteError:
+        raise
+    except Exception as e:
+        print(f"DB Fetch Error: {e}")
+        return None
+
+def get_cached_categories() -> list:
+    """Every category that currently has a row in market_trends (names only)."""
+    try:
+        with stage("supabase.fetch_categories"):
+            rows = cassette.call("supabase.fetch_categories", (), lambda: (
+                supabase.table("market_trends").select("category").execute().data
+            ))
+        return [row['category'] for row in rows or []]
+    except cassette.CassetteError:
+        raise
+    except Exception as e:
+        print(f"DB Fetch Error: {e}")
+        return []
 
 def get_cached_trends(category: str):
-    """Select the first row matching the category."""
+    """
+    Two-stage read of the category row:
+    1. fetch `last_updated` + `etag` only
+    2. fetch and decompress the payload only if our local copy has a different etag
+    Returns {"last_updated", "etag", "trends_json"} like the old select("*") row.
+    """
+    meta = get_trends_meta(category)
+    if not meta:
+        return None
+
+    # Rows written before compression have no etag; their timestamp identifies them instead
+    version = meta.get('etag') or meta['last_updated']
+    local = _PAYLOADS.get(category)
+    if local and local[0] == version:
+        return {**meta, "trends_json": local[1]}
+
     try:
-        response = supabase.table("market_trends").select("*").eq("category", category).execute()
-        return response.data[0] if response.data else None
+        with stage("supabase.fetch_payload"):
+            rows = cassette.call("supabase.fetch_payload", (category, version), lambda: (
+                supabase.table("market_trends").select("trends_zstd").eq("category", category).execute().data
+            ))
+        if not rows:
+            return None
+        if rows[0].get('trends_zstd'):
+            with stage("decompress"):
+                trends = _unpack(rows[0]['trends_zstd'])
+        else:
+            # Row written before compression (or by an older deploy)
+            with stage("supabase.fetch_payload"):
+                rows = cassette.call("supabase.fetch_legacy_payload", (category, version), lambda: (
+                    supabase.table("market_trends").select("trends_json").eq("category", category).execute().data
+                ))
+            trends = rows[0].get('trends_json') if rows else None
+    except cassette.CassetteError:
+        raise
     except Exception as e:
         print(f"DB Fetch Error: {e}")
         return None
 
+    _PAYLOADS[category] = (version, trends)
+    return {**meta, "trends_json": trends}
+
 def save_trends_to_db(category: str, trends: list):
-    """Insert or update the JSON data for this category."""
+    """
+    Insert or update the JSON data for this category.
+    Readers use trends_zstd; trends_json is still written so the previous backend
+    (which only reads trends_json) remains a safe rollback target.
+    """
     try:
+        etag, blob = _pack(trends)
         data = {
             "category": category,
+            "trends_zstd": blob,
+            "etag": etag,
             "trends_json": trends,
             "last_updated": "now()" # Let Postgres handle the timestamp
         }
-        supabase.table("market_trends").upsert(data, on_conflict="category").execute()
+        with stage("supabase.save_trends"):
+            cassette.call("supabase.save_trends", (category,), lambda: (
+                supabase.table("market_trends").upsert(data, on_conflict="category").execute().data
+            ))
+        _PAYLOADS[category] = (etag, trends)
+        return True
+    except cassette.CassetteError:
+        raise
+    except Exception as e:
+        print(f"DB Save Error: {e}")
+        return False
+
+def save_trend_snapshot(category: str, items: list):
+    """Append one generation to the snapshot history; returns the stored row."""
+    try:
+        data = {
+            "category": category,
+            "items": items,
+            "generated_at": "now()"
+        }
+        with stage("supabase.save_snapshot"):
+            rows = cassette.call("supabase.save_snapshot", (category,), lambda: (
+                supabase.table("trend_snapshots").insert(data).execute().data
+            ))
+        return rows[0] if rows else None
+    except cassette.CassetteError:
+        raise
+    except Exception as e:
+        print(f"DB Snapshot Save Error: {e}")
+        return None
+
+def get_trend_snapshots(category: str, limit: int, before: str | None = None):
+    """
+    Newest-first snapshots for a category, optionally only those generated at or before `before`.
+    Served by the (category, generated_at) index on trend_snapshots.
+    """
+    def fetch():
+        query = supabase.table("trend_snapshots").select("generated_at, items").eq("category", category)
+        if before:
+            query = query.lte("generated_at", before)
+        return query.order("generated_at", desc=True).limit(limit).execute().data
+
+    try:
+        # The cassette key ignores the `before` timestamp itself (it comes from the caller's
+        # `since`), so a recorded /diff replays for any `since` with the recorded baseline
+        with stage("supabase.fetch_snapshots"):
+            rows = cassette.call("supabase.fetch_snapshots", (category, limit, before is not None), fetch)
+        return rows or []
+    except cassette.CassetteError:
+        raise
     except Exception as e:
-        print(f"DB Save Error: {e}")
\ No newline at end of file
+        print(f"DB Snapshot Fetch Error: {e}")
+        return []
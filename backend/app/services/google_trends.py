@@ -128,29 +128,73 @@
 
 import json
 import os
-from datetime import datetime, timedelta, timezone
+import time
+from datetime import datetime, timedelta
 from google import genai
+from app.core import cassette
+from app.core.config import CACHE_REVALIDATE_SECONDS, DUPLICATE_SIMILARITY
+from app.core.profiling import stage
 from app.services.db_service import get_cached_trends, save_trends_to_db
-
-# Initialize Gemini Client
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-
-def fetch_ai_market_trends(category: str):
+from app.services.similarity_index import near_duplicates
+from app.services.snapshot_store import record_snapshot
+
+# Initialize Gemini Client (not needed when replaying recorded responses)
+client = None if cassette.REPLAYING else genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+
+CACHE_TTL = timedelta(hours=24)
+
+# category -> {"fresh_until", "checked_at", "version", "trends"}: in-process copy of the Supabase row.
+# Hits are served from it for CACHE_REVALIDATE_SECONDS, then revalidated with the meta/etag
+# read (the payload is only re-fetched if another instance refreshed the row)
+_LOCAL_CACHE = {}
+
+def _remember(category: str, last_updated: datetime, trends: list):
+    _LOCAL_CACHE[category] = {
+        "fresh_until": last_updated + CACHE_TTL,
+        "checked_at": time.monotonic(),
+        "version": last_updated.isoformat(),
+        "trends": trends
+    }
+
+def _local_entry(category: str):
+    entry = _LOCAL_CACHE.get(category)
+    if entry and cassette.now() < entry["fresh_until"]:
+        return entry
+    return None
+
+def cached_version(category: str) -> str | None:
+    """Identifies the generation currently served for a category (None if not cached)."""
+    entry = _local_entry(category)
+    return entry["version"] if entry else None
+
+def fetch_ai_market_trends(category: str, generate: bool = True):
     """
     Cache-Aside Logic: 
-    1. Check Supabase
+    1. Check the in-process copy (revalidated against Supabase every CACHE_REVALIDATE_SECONDS)
     2. If fresh (<24h), return it.
-    3. If stale/missing, call Gemini and update Supabase.
+    3. If stale/missing, call Gemini and update Supabase
+       (or return None when `generate` is False, so the caller can go through admission).
     """
     
-    # --- 1. CHECK SUPABASE CACHE ---
+    # --- 1. CHECK LOCAL + SUPABASE CACHE ---
+    entry = _local_entry(category)
+    if entry and time.monotonic() - entry["checked_at"] < CACHE_REVALIDATE_SECONDS:
+        return entry["trends"]
+
     cached_data = get_cached_trends(category)
     if cached_data:
         # Convert ISO string to timezone-aware datetime
         last_updated = datetime.fromisoformat(cached_data['last_updated'].replace('Z', '+00:00'))
-        if datetime.now(timezone.utc) - last_updated < timedelta(hours=24):
+        _remember(category, last_updated, cached_data['trends_json'])
+        if cassette.now() - last_updated < CACHE_TTL:
             print(f"--- [CACHE HIT] Serving {category} from Supabase ---")
             return cached_data['trends_json']
+    elif entry:
+        # Supabase unreachable: keep serving our copy until it expires rather than calling Gemini
+        return entry["trends"]
+
+    if not generate:
+        return None
 
     # --- 2. CALL GEMINI AI (Cache Miss) ---
     print(f"--- [CACHE MISS] Calling Gemini for {category} ---")
@@ -172,21 +216,34 @@ def fetch_ai_market_trends(category: str):
 
     try:
         # Using Gemini 2.5 Flash for speed and cost efficiency
-        response = client.models.generate_content(
-            model="gemini-2.5-flash", 
-            contents=prompt
-        )
+        # Keyed by category, not prompt, so recordings survive the month in the prompt changing
+        with stage("gemini.generate"):
+            response_text = cassette.call("gemini.generate", (category,), lambda: client.models.generate_content(
+                model="gemini-2.5-flash", 
+                contents=prompt
+            ).text)
         
         # Clean the response text from markdown code blocks
-        json_text = response.text.replace('```json', '').replace('```', '').strip()
-        new_trends = json.loads(json_text)
-
-        # --- 3. SAVE TO SUPABASE ---
-        if new_trends:
-            save_trends_to_db(category, new_trends)
+        with stage("json.cleanup"):
+            json_text = response_text.replace('```json', '').replace('```', '').strip()
+            new_trends = json.loads(json_text)
+
+        # Gemini sometimes repeats an item under a slightly different title;
+        # drop those before anything is stored or snapshotted
+        with stage("dedupe"):
+            duplicates = set(near_duplicates([item.get('title', '') for item in new_trends], DUPLICATE_SIMILARITY))
+            new_trends = [item for i, item in enumerate(new_trends) if i not in duplicates]
+
+        # --- 3. SAVE TO SUPABASE (current row, then its history snapshot) ---
+        if new_trends and save_trends_to_db(category, new_trends):
+            record_snapshot(category, new_trends)
+            _remember(category, cassette.now(), new_trends)
             
         return new_trends
 
+    except cassette.CassetteError:
+        # A replay that asks for something never recorded must fail, not look like a Gemini outage
+        raise
     except Exception as e:
         print(f"AI Service Failure: {e}")
         # 2. UPDATED FALLBACK: Ensuring keys match so frontend doesn't show blank cards
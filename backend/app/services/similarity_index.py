@@ -0,0 +1,166 @@
+import threading
+import zlib
+
+import numpy as np
+
+from app.core.config import SIMILARITY_DIM
+
+NGRAM = 3
+
+
+def _ngrams(text: str):
+    for word in text.lower().split():
+        padded = f" {word} "
+        if len(padded) <= NGRAM:
+            yield padded
+            continue
+        for i in range(len(padded) - NGRAM + 1):
+            yield padded[i:i + NGRAM]
+
+
+def embed(texts: list) -> np.ndarray:
+    """
+    Offline embeddings: signed hashed character trigrams, L2-normalized.
+    crc32 keeps the hashing stable across processes (unlike hash()).
+    """
+    vectors = np.zeros((len(texts), SIMILARITY_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        hashes = np.fromiter((zlib.crc32(g.encode()) for g in _ngrams(text)), dtype=np.uint32)
+        if not hashes.size:
+            continue
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(vectors[row], hashes % SIMILARITY_DIM, signs)
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def near_duplicates(texts: list, threshold: float) -> list:
+    """Indices of texts that are near-duplicates of an earlier text (first occurrence wins)."""
+    if len(texts) < 2:
+        return []
+    vectors = embed(texts)
+    sims = vectors @ vectors.T
+    dropped = []
+    kept = []
+    for i in range(len(texts)):
+        if kept and sims[i, kept].max() >= threshold:
+            dropped.append(i)
+        else:
+            kept.append(i)
+    return dropped
+
+
+class SimilarityIndex:
+    """
+    Cosine top-k index over trend items.
+    Vectors live in one contiguous float32 matrix; rows [0, size) are live.
+    Removal moves the last row into the hole so the live block stays dense.
+    """
+
+    def __init__(self, dim: int = SIMILARITY_DIM):
+        self.matrix = np.zeros((64, dim), dtype=np.float32)
+        self.size = 0
+        self.ids = []          # row -> item id
+        self.payloads = []     # row -> whatever the caller wants back (e.g. a TrendRecord)
+        self.rows = {}         # item id -> row
+        self.by_group = {}     # group (category) -> set of item ids
+        self.lock = threading.Lock()
+
+    def _grow(self, needed: int):
+        if needed <= len(self.matrix):
+            return
+        capacity = len(self.matrix)
+        while capacity < needed:
+            capacity *= 2
+        grown = np.zeros((capacity, self.matrix.shape[1]), dtype=np.float32)
+        grown[:self.size] = self.matrix[:self.size]
+        self.matrix = grown
+
+    def _remove(self, item_id: str):
+        row = self.rows.pop(item_id)
+        last = self.size - 1
+        if row != last:
+            self.matrix[row] = self.matrix[last]
+            self.ids[row] = self.ids[last]
+            self.payloads[row] = self.payloads[last]
+            self.rows[self.ids[row]] = row
+        self.ids.pop()
+        self.payloads.pop()
+        self.size = last
+
+    def _upsert(self, group: str, ids: list, vectors: np.ndarray, payloads: list):
+        self._grow(self.size + len(ids))
+        for item_id, vector, payload in zip(ids, vectors, payloads):
+            row = self.rows.get(item_id)
+            if row is None:
+                row = self.size
+                self.rows[item_id] = row
+                self.ids.append(item_id)
+                self.payloads.append(payload)
+                self.size += 1
+            else:
+                self.payloads[row] = payload
+            self.matrix[row] = vector
+        self.by_group.setdefault(group, set()).update(ids)
+
+    def _remove_many(self, ids):
+        for item_id in ids:
+            if item_id in self.rows:
+                self._remove(item_id)
+        for members in self.by_group.values():
+            members.difference_update(ids)
+
+    def upsert(self, group: str, ids: list, texts: list, payloads: list):
+        vectors = embed(texts)
+        with self.lock:
+            self._upsert(group, ids, vectors, payloads)
+
+    def remove(self, ids):
+        with self.lock:
+            self._remove_many(ids)
+
+    def replace_group(self, group: str, ids: list, texts: list, payloads: list):
+        """Incremental refresh: drop the group's items that disappeared, upsert the rest (atomically)."""
+        vectors = embed(texts)
+        with self.lock:
+            stale = self.by_group.get(group, set()) - set(ids)
+            if stale:
+                self._remove_many(stale)
+            self._upsert(group, ids, vectors, payloads)
+
+    def groups(self) -> set:
+        with self.lock:
+            return {group for group, members in self.by_group.items() if members}
+
+    def related(self, ids: list, k: int) -> list:
+        """
+        Batched cosine top-k for already-indexed items.
+        Returns one list of (payload, similarity) per id, excluding the item itself;
+        unknown ids get None.
+        """
+        with self.lock:
+            rows = [self.rows.get(item_id) for item_id in ids]
+            known = [row for row in rows if row is not None]
+            if not known:
+                return [None] * len(ids)
+
+            live = self.matrix[:self.size]
+            sims = live[known] @ live.T
+            sims[np.arange(len(known)), known] = -np.inf
+
+            k = min(k, self.size - 1)
+            matches = {}
+            for i, row in enumerate(known):
+                if k <= 0:
+                    matches[row] = []
+                    continue
+                top = np.argpartition(-sims[i], k - 1)[:k]
+                top = top[np.argsort(-sims[i, top])]
+                matches[row] = [(self.payloads[col], float(sims[i, col])) for col in top]
+
+            return [matches[row] if row is not None else None for row in rows]
+
+
+related_index = SimilarityIndex()
@@ -0,0 +1,147 @@
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from app.core import cassette
+from app.core.config import SNAPSHOT_HISTORY_DEPTH
+from app.services.db_service import get_trend_snapshots, save_trend_snapshot
+
+
+@dataclass(slots=True, frozen=True)
+class Snapshot:
+    """One stored generation: item key -> confidence score (and display title)."""
+    generated_at: datetime
+    scores: dict
+    titles: dict
+
+
+# category -> snapshots, oldest first, at most SNAPSHOT_HISTORY_DEPTH long
+_INDEX = {}
+_LOCK = threading.Lock()
+
+
+def trend_key(item: dict) -> str:
+    """Stable identity of a trend item across generations (the part of the id after the category)."""
+    return item.get('title', 'Trending Item').lower().replace(' ', '_')
+
+def trend_score(item: dict) -> float:
+    score = item.get('confidence_score', item.get('confidenceScore', 50))
+    try:
+        return float(score)
+    except (TypeError, ValueError):
+        return 50.0
+
+def _parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def _from_row(row: dict) -> Snapshot:
+    # Rows store items compactly as [key, title, score]
+    items = row.get('items') or []
+    return Snapshot(
+        generated_at=_parse_time(row['generated_at']),
+        scores={key: score for key, _, score in items},
+        titles={key: title for key, title, _ in items}
+    )
+
+def _load(category: str) -> list:
+    """
+    (Re)load a category's recent snapshots from Supabase, merged with the ones already in memory.
+    Empty results are not cached, so arbitrary category names can't grow the index.
+    """
+    rows = get_trend_snapshots(category, SNAPSHOT_HISTORY_DEPTH)
+    loaded = [_from_row(row) for row in rows]
+    with _LOCK:
+        known = {s.generated_at for s in loaded}
+        snapshots = loaded + [s for s in _INDEX.get(category, []) if s.generated_at not in known]
+        if not snapshots:
+            return snapshots
+        snapshots.sort(key=lambda s: s.generated_at)
+        del snapshots[:-SNAPSHOT_HISTORY_DEPTH]
+        _INDEX[category] = snapshots
+    return snapshots
+
+def _history(category: str) -> list:
+    """Snapshots for a category, loading them from Supabase the first time."""
+    snapshots = _INDEX.get(category)
+    if snapshots is None:
+        snapshots = _load(category)
+    return snapshots
+
+def sync_history(category: str, as_of: datetime):
+    """
+    Reload the history if it has nothing as recent as `as_of` (the served row's last_updated),
+    i.e. another instance generated the row and recorded its snapshot.
+    """
+    snapshots = _INDEX.get(category)
+    if not snapshots or snapshots[-1].generated_at < as_of:
+        _load(category)
+
+def record_snapshot(category: str, trends: list):
+    """Store a freshly generated (and successfully saved) trend list as a new snapshot."""
+    # Load the existing history before inserting, otherwise the load would already include the new row
+    history = _history(category)
+
+    items = [[trend_key(item), item.get('title', 'Trending Item'), trend_score(item)] for item in trends]
+    row = save_trend_snapshot(category, items)
+    generated_at = _parse_time(row['generated_at']) if row else cassette.now()
+
+    snapshot = _from_row({"generated_at": generated_at.isoformat(), "items": items})
+    with _LOCK:
+        history = _INDEX.setdefault(category, history)
+        if any(s.generated_at == snapshot.generated_at for s in history):
+            return
+        history.append(snapshot)
+        del history[:-SNAPSHOT_HISTORY_DEPTH]
+
+def snapshot_count(category: str) -> int:
+    return len(_history(category))
+
+def score_histories(category: str) -> dict:
+    """item key -> scores across the recent snapshots it appeared in, oldest first."""
+    histories = {}
+    for snapshot in list(_history(category)):
+        for key, score in snapshot.scores.items():
+            histories.setdefault(key, []).append(score)
+    return histories
+
+def _snapshot_at(category: str, since: datetime):
+    """Newest snapshot generated at or before `since`; falls back to Supabase beyond the in-memory window."""
+    for snapshot in reversed(_history(category)):
+        if snapshot.generated_at <= since:
+            return snapshot
+
+    rows = get_trend_snapshots(category, 1, before=since.isoformat())
+    return _from_row(rows[0]) if rows else None
+
+def diff_since(category: str, since: datetime) -> dict:
+    """What rose, fell, appeared or dropped between `since` and the latest snapshot."""
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+
+    diff = {"rose": [], "fell": [], "appeared": [], "dropped": []}
+    # Re-query so snapshots recorded by other instances are part of the diff
+    history = _load(category)
+    if not history:
+        return diff
+
+    current = history[-1]
+    baseline = _snapshot_at(category, since)
+    before = baseline.scores if baseline else {}
+
+    for key, score in current.scores.items():
+        item_id = f"{category}_{key}"
+        title = current.titles[key]
+        if key not in before:
+            diff["appeared"].append({"id": item_id, "title": title, "to": score})
+        elif score != before[key]:
+            change = {"id": item_id, "title": title, "from": before[key], "to": score, "change": score - before[key]}
+            diff["rose" if score > before[key] else "fell"].append(change)
+
+    for key, score in before.items():
+        if key not in current.scores:
+            diff["dropped"].append({"id": f"{category}_{key}", "title": baseline.titles[key], "from": score})
+
+    diff["rose"].sort(key=lambda c: c["change"], reverse=True)
+    diff["fell"].sort(key=lambda c: c["change"])
+    return diff
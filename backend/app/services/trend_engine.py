@@ -261,15 +261,86 @@
 
 
 
+import sys
+import threading
+import time
+from dataclasses import dataclass
 from datetime import datetime
-from app.services.google_trends import fetch_ai_market_trends
+from enum import Enum
 
-def estimate_timeframe(score: float) -> str:
+import orjson
+
+from app.core.config import KEYWORDS_BY_CATEGORY
+from app.core.profiling import stage
+from app.services.db_service import get_cached_categories
+from app.services.google_trends import cached_version, fetch_ai_market_trends
+from app.services.similarity_index import related_index
+from app.services.snapshot_store import score_histories, snapshot_count, sync_history, trend_key, trend_score
+
+
+class Level(str, Enum):
+    EASY = "Easy"
+    MEDIUM = "Medium"
+    HARD = "Hard"
+
+
+class Momentum(str, Enum):
+    SURGING = "Surging"
+    RISING = "Rising"
+    STABLE = "Stable"
+    DECLINING = "Declining"
+    NEW = "New"
+
+
+class TimeFrame(str, Enum):
+    IMMEDIATE = "Immediate (1 week)"
+    SHORT_TERM = "Short-term (1 month)"
+    MID_TERM = "Mid-term (3 months)"
+    SEASONAL = "Seasonal (6+ months)"
+
+
+_LEVELS = {m.value: m for m in Level}
+_MOMENTUMS = {m.value: m for m in Momentum}
+
+
+def _label(value, known: dict, default):
+    """Map an AI label onto its enum member; unknown labels are interned so repeats share one string."""
+    if value is None:
+        return default
+    return known.get(value) or sys.intern(str(value))
+
+
+@dataclass(slots=True, frozen=True)
+class TrendRecord:
+    """One normalized trend card. Field names are the wire keys, so orjson encodes it as-is."""
+    id: str
+    title: str
+    description: str
+    level: str
+    momentum: str
+    confidenceScore: float
+    timeFrame: str
+    confidenceDrift: float | None
+    categories: tuple
+    actions: tuple
+
+
+# category -> (source version, records, encoded /api/trends response body)
+_RESPONSE_CACHE = {}
+
+# The related index fills as categories are served; unknown ids trigger a (throttled) warm-up
+# from every cached category so restarts and other instances can answer too
+RELATED_WARM_INTERVAL_SECONDS = 300
+_related_warm = {"at": None}
+_related_warm_lock = threading.Lock()
+
+
+def estimate_timeframe(score: float) -> TimeFrame:
     """Calculates urgency based on the AI's confidence score."""
-    if score >= 90: return "Immediate (1 week)"
-    if score >= 80: return "Short-term (1 month)"
-    if score >= 70: return "Mid-term (3 months)"
-    return "Seasonal (6+ months)"
+    if score >= 90: return TimeFrame.IMMEDIATE
+    if score >= 80: return TimeFrame.SHORT_TERM
+    if score >= 70: return TimeFrame.MID_TERM
+    return TimeFrame.SEASONAL
 
 def _generate_ai_actions(item: dict) -> list:
     """Generates artisan-specific advice based on trend data."""
@@ -289,32 +360,147 @@ def _generate_ai_actions(item: dict) -> list:
         
     return actions
 
+def derive_momentum(scores: list, has_history: bool):
+    """
+    Momentum from an item's confidence scores across recent snapshots (oldest first).
+    Compares the latest score to the average of the up-to-3 before it.
+    Returns None when there is no history to compare against.
+    """
+    if len(scores) < 2:
+        return Momentum.NEW if has_history else None
+
+    previous = scores[-4:-1]
+    delta = scores[-1] - sum(previous) / len(previous)
+    if delta >= 15: return Momentum.SURGING
+    if delta >= 5: return Momentum.RISING
+    if delta <= -5: return Momentum.DECLINING
+    return Momentum.STABLE
+
+def _build_record(item: dict, category: str, histories: dict, has_history: bool) -> TrendRecord:
+    # Standardize the Confidence Score
+    score = item.get('confidence_score', item.get('confidenceScore', 50))
+    title = item.get('title', 'Trending Item')
+    key = trend_key(item)
+
+    # Momentum/drift come from our own snapshots; the AI label is only used before any history exists
+    scores = histories.get(key) or [trend_score(item)]
+    momentum = derive_momentum(scores, has_history) or _label(item.get('momentum'), _MOMENTUMS, Momentum.STABLE)
+    drift = scores[-1] - scores[-2] if len(scores) > 1 else None
+
+    # Gemini occasionally returns a single category as a bare string
+    categories = item.get('categories', [category])
+    if isinstance(categories, str):
+        categories = [categories]
+
+    return TrendRecord(
+        id=f"{category}_{key}",
+        title=title.title(),
+        description=item.get('reason', item.get('description', 'Trend detected.')),
+        level=_label(item.get('level'), _LEVELS, Level.MEDIUM),
+        momentum=momentum,
+        confidenceScore=score,
+        timeFrame=estimate_timeframe(score),
+        confidenceDrift=drift,
+        categories=tuple(categories),
+        actions=tuple(_generate_ai_actions({**item, 'momentum': momentum}))
+    )
+
+def _similarity_text(record: TrendRecord) -> str:
+    return " ".join((record.title, record.description, *record.categories))
+
+def _to_dict(record: TrendRecord) -> dict:
+    """Plain JSON-shaped dict (str labels, lists) exactly as the record goes over the wire."""
+    return orjson.loads(orjson.dumps(record))
+
+def _encode_response(category: str, records: list) -> bytes:
+    return orjson.dumps({
+        "status": "success",
+        "category": category,
+        "count": len(records),
+        "data": records
+    })
+
+def _get_cached_response(category: str, generate: bool = True):
+    """
+    Returns (records, body) for a category.
+    Records and the encoded body are built once per refresh and reused until
+    the source generation changes; uncached fallbacks are rebuilt every call.
+    With `generate=False`, returns None instead of calling Gemini on a miss.
+    """
+    raw_data = fetch_ai_market_trends(category, generate)
+    if raw_data is None and not generate:
+        return None
+    raw_data = raw_data or []
+    version = cached_version(category)
+
+    cached = _RESPONSE_CACHE.get(category)
+    if cached and version is not None and cached[0] == version:
+        return cached[1], cached[2]
+
+    if version is None:
+        with stage("normalize"):
+            records = [_build_record(item, category, {}, False) for item in raw_data]
+        with stage("encode"):
+            return records, _encode_response(category, records)
+
+    # The version is the row's last_updated; pick up snapshots other instances recorded for it
+    sync_history(category, datetime.fromisoformat(version))
+    histories = score_histories(category)
+    has_history = snapshot_count(category) > 1
+    with stage("normalize"):
+        records = [_build_record(item, category, histories, has_history) for item in raw_data]
+    with stage("encode"):
+        body = _encode_response(category, records)
+    _RESPONSE_CACHE[category] = (version, records, body)
+
+    with stage("similarity.index"):
+        related_index.replace_group(
+            category,
+            [record.id for record in records],
+            [_similarity_text(record) for record in records],
+            records
+        )
+    return records, body
+
+def get_trends_response(category: str = "decor", generate: bool = True) -> bytes | None:
+    """Pre-serialized /api/trends body for a category (None on a miss when `generate` is False)."""
+    cached = _get_cached_response(category, generate)
+    return cached[1] if cached else None
+
 def get_trends(category: str = "decor"):
     """
     Main Orchestrator:
     Normalizes data so the Frontend never sees a 'KeyError'.
     """
-    raw_data = fetch_ai_market_trends(category)
-    if not raw_data:
-        return []
-
-    processed_suggestions = []
-    for item in raw_data:
-        # Standardize the Confidence Score
-        score = item.get('confidence_score', item.get('confidenceScore', 50))
-        title = item.get('title', 'Trending Item')
-        
-        # Build the Frontend-ready object
-        processed_suggestions.append({
-            "id": f"{category}_{title.lower().replace(' ', '_')}",
-            "title": title.title(),
-            "description": item.get('reason', item.get('description', 'Trend detected.')),
-            "level": item.get('level', 'Medium'),
-            "momentum": item.get('momentum', 'Stable'),
-            "confidenceScore": score,
-            "timeFrame": estimate_timeframe(score),
-            "categories": item.get('categories', [category]),
-            "actions": _generate_ai_actions(item)
-        })
-        
-    return processed_suggestions
\ No newline at end of file
+    records, _ = _get_cached_response(category)
+    return [_to_dict(record) for record in records]
+
+def _warm_related_index():
+    """Index every cached category not indexed yet, from cache only (never calls Gemini)."""
+    with _related_warm_lock:
+        last = _related_warm["at"]
+        if last is not None and time.monotonic() - last < RELATED_WARM_INTERVAL_SECONDS:
+            return
+        _related_warm["at"] = time.monotonic()
+
+        indexed = related_index.groups()
+        categories = set(get_cached_categories()) | set(KEYWORDS_BY_CATEGORY)
+        for category in categories - indexed:
+            _get_cached_response(category, generate=False)
+
+def get_related_trends(trend_id: str, k: int = 5):
+    """
+    Most similar cached trends to `trend_id`, across all cached categories.
+    Returns None if the id is not in the index.
+    """
+    matches = related_index.related([trend_id], k)[0]
+    if matches is None:
+        _warm_related_index()
+        matches = related_index.related([trend_id], k)[0]
+        if matches is None:
+            return None
+    return [
+        {**_to_dict(record), "similarity": round(similarity, 4)}
+        for record, similarity in matches
+        if similarity > 0
+    ]
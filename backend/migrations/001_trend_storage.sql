@@ -0,0 +1,20 @@
+-- Trend storage: compressed market_trends payloads + snapshot history.
+-- Run once in the Supabase SQL editor before deploying the backend that uses these columns.
+-- Idempotent, and additive only: trends_json keeps being written, so the previous
+-- backend can still be rolled back to.
+
+-- market_trends: zstd-compressed, base64-encoded payload and a hash of the uncompressed JSON
+alter table market_trends add column if not exists trends_zstd text;
+alter table market_trends add column if not exists etag text;
+
+-- One row per generation, items stored compactly as [key, title, score]
+create table if not exists trend_snapshots (
+    id bigint generated by default as identity primary key,
+    category text not null,
+    generated_at timestamptz not null default now(),
+    items jsonb not null
+);
+
+-- Serves "newest N for a category" and "newest at or before <time>" lookups
+create index if not exists trend_snapshots_category_generated_at_idx
+    on trend_snapshots (category, generated_at desc);